@@ -1,45 +1,82 @@
 import os
-from dotenv import load_dotenv
+from pathlib import Path
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import ClassVar
+from dotenv import dotenv_values
 
-load_dotenv()
+# Parse .env once and overlay a single snapshot of the process environment,
+# so settings resolve from a plain dict instead of repeated os.environ lookups.
+# The file is read from next to this module, whatever the working directory.
+# Bare keys (no "=") parse as None and are skipped so defaults still apply
+_ENV = {
+    **{key: value for key, value in dotenv_values(Path(__file__).with_name(".env")).items() if value is not None},
+    **os.environ,
+}
 
+def _env_flag(name: str) -> bool:
+    return _ENV.get(name, "false").lower() in ("1", "true", "yes")
+
+@dataclass(frozen=True)
 class Settings:
     PROJECT_NAME = "SecureShare Backend"
     PROJECT_VERSION = "1.0.0"
-    
+    DEBUG = _env_flag("DEBUG")
+
     # Security
-    SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
+    SECRET_KEY = _ENV.get("SECRET_KEY", "your-secret-key-change-in-production")
     ALGORITHM = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES = 30
-    
+
+    # CORS: comma-separated origins, "*" allows any, empty disables the middleware
+    ALLOWED_ORIGINS: ClassVar[frozenset[str]] = frozenset(
+        origin.strip() for origin in _ENV.get("ALLOWED_ORIGINS", "*").split(",") if origin.strip()
+    )
+
     # Database
-    DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./secure_share.db")
-    
+    DATABASE_URL = _ENV.get("DATABASE_URL", "sqlite:///./secure_share.db")
+    DB_POOL_SIZE = int(_ENV.get("DB_POOL_SIZE", "15"))
+    DB_MAX_OVERFLOW = int(_ENV.get("DB_MAX_OVERFLOW", "8"))
+    DB_POOL_TIMEOUT = int(_ENV.get("DB_POOL_TIMEOUT", "5"))  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(_ENV.get("DB_POOL_RECYCLE", "300"))  # seconds before a pooled connection is replaced
+
     # Redis for caching and rate limiting
-    REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
-    
+    REDIS_URL = _ENV.get("REDIS_URL", "redis://localhost:6379")
+    SESSION_CACHE_ENABLED = _env_flag("SESSION_CACHE_ENABLED")  # Serve streams from Redis
+    SESSION_CACHE_TTL = 3600  # seconds, for sessions on content without an expiry
+    SESSION_FLUSH_SECONDS = 10  # how often cached view counts are written back to SQL
+
     # File upload settings
     MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
-    ALLOWED_CONTENT_TYPES = {
+    # Larger text is served by URL instead of base64 in JSON. The receive screen
+    # cannot decrypt streamed text yet, so every accepted text upload is inlined
+    INLINE_TEXT_MAX_BYTES = MAX_FILE_SIZE
+    ALLOWED_CONTENT_TYPES: ClassVar[frozenset[str]] = frozenset({
         'image/jpeg', 'image/png', 'image/gif',
         'application/pdf',
         'video/mp4', 'video/quicktime',
         'audio/mpeg', 'audio/wav',
         'text/plain',
         'application/msword',
-        'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-    }
-    
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'application/octet-stream',  # Client fallback for generic documents
+    })
+
     # Security settings
     MAX_PIN_ATTEMPTS = 3
     PIN_LOCKOUT_MINUTES = 15
-    PIN_ROTATION_INTERVALS = [10, 30, 60, 120, 360, 720]  # minutes
-    
+    PIN_ROTATION_INTERVALS = (10, 30, 60, 120, 360, 720)  # minutes
+
     # Cloud storage (configure based on your provider)
-    CLOUD_PROVIDER = os.getenv("CLOUD_PROVIDER", "local")  # local, s3, gcs
-    CLOUD_BUCKET = os.getenv("CLOUD_BUCKET", "secure-share-content")
-    
+    CLOUD_PROVIDER = _ENV.get("CLOUD_PROVIDER", "local")  # local, s3, gcs
+    CLOUD_BUCKET = _ENV.get("CLOUD_BUCKET", "secure-share-content")
+
     # Content cleanup
     CLEANUP_INTERVAL_MINUTES = 5
 
-settings = Settings()
\ No newline at end of file
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide settings instance"""
+    return Settings()
+
+settings = get_settings()
@@ -1,22 +1,130 @@
-from sqlalchemy import create_engine
+import calendar
+from cryptography.fernet import InvalidToken
+from sqlalchemy import inspect, or_, select, text, update
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 from config import settings
+from security import SecurityUtils
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    connect_args={"check_same_thread": False} if settings.DATABASE_URL.startswith("sqlite") else {}
+# Async driver per supported backend; any driver named in DATABASE_URL
+# (e.g. postgresql+psycopg2) is swapped for it, since the engine is async-only
+_ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+_url = make_url(settings.DATABASE_URL)
+if _url.get_backend_name() not in _ASYNC_DRIVERS:
+    raise ValueError(f"Unsupported DATABASE_URL backend: {_url.get_backend_name()}")
+_url = _url.set(drivername=_ASYNC_DRIVERS[_url.get_backend_name()])
+_is_sqlite = _url.get_backend_name() == "sqlite"
+
+if _is_sqlite and _url.database in (None, "", ":memory:"):
+    # One shared connection keeps an in-memory database alive across sessions
+    pool_options = {"poolclass": StaticPool}
+else:
+    pool_options = {
+        "poolclass": AsyncAdaptedQueuePool,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+engine = create_async_engine(
+    _url,
+    connect_args={"check_same_thread": False} if _is_sqlite else {},
+    **pool_options
 )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay readable after commit without an implicit (and forbidden) async refresh
+AsyncSessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
+def _rebuild_sqlite_table(conn, table, existing_columns):
+    """Recreate a SQLite table from the model, keeping its rows"""
+    legacy = f"_legacy_{table.name}"
+    # Keep other tables' foreign keys pointing at the original name
+    conn.execute(text("PRAGMA legacy_alter_table=ON"))
+    conn.execute(text(f'ALTER TABLE "{table.name}" RENAME TO "{legacy}"'))
+    conn.execute(text("PRAGMA legacy_alter_table=OFF"))
+    for index in inspect(conn).get_indexes(legacy):
+        conn.execute(text(f'DROP INDEX "{index["name"]}"'))
+    table.create(conn)
+    columns = ", ".join(f'"{column.name}"' for column in table.columns if column.name in existing_columns)
+    conn.execute(text(f'INSERT INTO "{table.name}" ({columns}) SELECT {columns} FROM "{legacy}"'))
+    conn.execute(text(f'DROP TABLE "{legacy}"'))
+
+def _upgrade_schema(conn):
+    """Bring tables created by older models up to date (create_all never alters them)"""
+    preparer = conn.dialect.identifier_preparer
+    for table in Base.metadata.sorted_tables:
+        existing_columns = {column["name"]: column for column in inspect(conn).get_columns(table.name)}
+        # Columns the models have since made nullable, e.g. pins.pin_value
+        relaxed = [
+            column.name for column in table.columns
+            if column.nullable and column.name in existing_columns and not existing_columns[column.name]["nullable"]
+        ]
+        if relaxed and conn.dialect.name == "sqlite":
+            # SQLite cannot drop NOT NULL in place; the rebuild also adds new columns and indexes
+            _rebuild_sqlite_table(conn, table, existing_columns)
+            continue
+        table_name = preparer.format_table(table)
+        for name in relaxed:
+            conn.execute(text(f"ALTER TABLE {table_name} ALTER COLUMN {preparer.quote(name)} DROP NOT NULL"))
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {preparer.format_column(column)} {column_type}"))
+        existing_indexes = {index["name"] for index in inspect(conn).get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(conn)
+
+def _backfill_legacy_rows(conn):
+    """Fill derived columns that rows written by older versions lack"""
+    content = Base.metadata.tables["content"]
+    pins = Base.metadata.tables["pins"]
+
+    # Expiry checks compare expires_at_ts only
+    expiring = conn.execute(
+        select(content.c.id, content.c.expires_at)
+        .where(content.c.expires_at_ts.is_(None), content.c.expires_at.isnot(None))
+    ).all()
+    for content_id, expires_at in expiring:
+        conn.execute(
+            update(content).where(content.c.id == content_id)
+            .values(expires_at_ts=calendar.timegm(expires_at.utctimetuple()))
+        )
+
+    # Access finds PINs by lookup key and verifies the HMAC hash; older rows have
+    # neither (their pin_hash is a PBKDF2 "salt:hash") but kept the PIN Fernet-encrypted
+    legacy_pins = conn.execute(
+        select(pins.c.id, pins.c.pin_value)
+        .where(
+            pins.c.pin_value.isnot(None),
+            or_(pins.c.pin_lookup_hmac.is_(None), pins.c.pin_hash.contains(":"))
+        )
+    ).all()
+    for pin_id, pin_value in legacy_pins:
+        try:
+            pin = SecurityUtils.decrypt_key_from_storage(pin_value)
+        except InvalidToken:
+            continue  # Encrypted under a different SECRET_KEY
+        conn.execute(
+            update(pins).where(pins.c.id == pin_id)
+            .values(pin_lookup_hmac=SecurityUtils.pin_lookup(pin), pin_hash=SecurityUtils.hash_pin(pin))
+        )
+
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_upgrade_schema)
+        await conn.run_sync(_backfill_legacy_rows)
@@ -0,0 +1,25 @@
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from config import settings
+
+_listener = None
+
+def setup_logging():
+    """Route app logging through a queue so handler I/O runs off the request path"""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+    root = logging.getLogger()
+    root.addHandler(QueueHandler(log_queue))
+    root.setLevel(logging.DEBUG if settings.DEBUG else logging.INFO)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
@@ -1,24 +1,159 @@
 from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
-from sqlalchemy.orm import Session
-import uuid
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.inmemory import InMemoryBackend
+from fastapi_cache.decorator import cache
+from sqlalchemy import and_, func, insert, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from redis.exceptions import RedisError
+import asyncio
+import logging
 import json
+import time
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 import os
 from pathlib import Path
 import base64
 # Import your modules
 from config import settings
-from database import get_db, init_db
+from logging_config import setup_logging
+from database import engine, get_db, init_db, AsyncSessionLocal
 from models import Content, PIN, AccessSession
 from security import SecurityUtils
+from session_cache import SessionCache
 from utils import FileUtils, ContentUtils, TimeUtils  # ADD ContentUtils and TimeUtils
 
+setup_logging()
+logger = logging.getLogger(__name__)
+
+class ChunkedFileResponse(FileResponse):
+    """FileResponse that reads 1MB per thread-pool hop instead of Starlette's 64KB"""
+    chunk_size = 1024 * 1024
+
+async def _write_back_session_views():
+    """Persist view counts accumulated in the session cache"""
+    drained = await SessionCache.drain_views()
+    if not drained:
+        return
+    async with AsyncSessionLocal() as db:
+        for session_token, views, last_activity_ts in drained:
+            values = {AccessSession.view_count: AccessSession.view_count + views}
+            if last_activity_ts:
+                values[AccessSession.last_activity] = datetime.utcfromtimestamp(last_activity_ts)
+            await db.execute(
+                update(AccessSession)
+                .where(AccessSession.session_token == session_token)
+                .values(values)
+                .execution_options(synchronize_session=False)
+            )
+        await db.commit()
+
+async def _load_active_pins():
+    """Seed the cache's active PIN filter from live content"""
+    # Read before the query, so a loss during the load keeps the filter untrusted
+    epoch = SessionCache.active_pins_epoch()
+    async with AsyncSessionLocal() as db:
+        pin_lookups = await db.scalars(
+            select(PIN.pin_lookup_hmac).join(Content).where(
+                PIN.is_active == True,
+                PIN.pin_lookup_hmac.isnot(None),
+                Content.status == "active"
+            )
+        )
+        await SessionCache.load_active_pins(list(pin_lookups), epoch)
+
+async def _pin_lookup_in_use(db: AsyncSession, pin_record: PIN) -> bool:
+    """Whether another live PIN shares this PIN's lookup key"""
+    return await db.scalar(
+        select(PIN.id).join(Content).where(
+            PIN.pin_lookup_hmac == pin_record.pin_lookup_hmac,
+            PIN.id != pin_record.id,
+            PIN.is_active == True,
+            Content.status == "active"
+        ).limit(1)
+    ) is not None
+
+async def _release_pin_lookup(db: AsyncSession, pin_record: PIN):
+    """Drop a PIN from the cache filter unless another live PIN shares its lookup key"""
+    if not SessionCache.enabled() or not pin_record.pin_lookup_hmac:
+        return
+    if await _pin_lookup_in_use(db, pin_record):
+        return
+    await SessionCache.remove_active_pin(pin_record.pin_lookup_hmac)
+    # An upload reusing this PIN can commit and add it between the check and the
+    # removal; look again in a fresh transaction and put it back if so
+    await db.commit()
+    if await _pin_lookup_in_use(db, pin_record):
+        try:
+            await SessionCache.add_active_pin(pin_record.pin_lookup_hmac)
+        except RedisError:
+            SessionCache.distrust_active_pins()
+            raise
+
+async def _retire_content(db: AsyncSession, content: Content, pin_record: PIN, status: str):
+    """Move live content to a terminal status; only the request that wins the transition cleans up"""
+    result = await db.execute(
+        update(Content)
+        .where(Content.id == content.id, Content.status == "active")
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    if result.rowcount == 1 and SessionCache.enabled():
+        # The status change is committed; the cache is best-effort from here
+        try:
+            await SessionCache.invalidate_content(content.id)
+            await _release_pin_lookup(db, pin_record)
+        except RedisError as e:
+            logger.warning("⚠️ Session cache invalidation failed for %s: %s", content.id, e)
+
+async def _flush_session_cache():
+    while True:
+        await asyncio.sleep(settings.SESSION_FLUSH_SECONDS)
+        try:
+            await _write_back_session_views()
+            if not SessionCache.active_pins_trusted():
+                await _load_active_pins()
+                logger.info("⚡ Active PIN filter reloaded")
+        except Exception as e:
+            logger.warning("⚠️ Session cache flush failed: %s", e)
+
+# Initialize database once at startup
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_db()
+    FastAPICache.init(InMemoryBackend())
+    logger.info("✅ Database initialized")
+    logger.debug("🔐 Using SECRET_KEY: %s...", settings.SECRET_KEY[:20])
+    logger.info("📁 Database: %s", settings.DATABASE_URL)
+    flush_task = None
+    if SessionCache.enabled():
+        try:
+            await _load_active_pins()
+        except RedisError as e:
+            # Access falls back to SQL; the flush loop retries the load
+            SessionCache.distrust_active_pins()
+            logger.warning("⚠️ Active PIN filter load failed: %s", e)
+        flush_task = asyncio.create_task(_flush_session_cache())
+        logger.info("⚡ Session cache: %s", settings.REDIS_URL)
+    yield
+    if flush_task:
+        flush_task.cancel()
+        try:
+            await _write_back_session_views()
+        except RedisError as e:
+            logger.warning("⚠️ Final session cache flush failed: %s", e)
+        await SessionCache.close()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.PROJECT_VERSION,
+    default_response_class=ORJSONResponse,  # Serializes datetimes natively
+    lifespan=lifespan,
 )
 
 # Create uploads directory
@@ -28,27 +163,23 @@ uploads_dir.mkdir(exist_ok=True)
 # Mount static files for uploaded content
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins for testing
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# CORS middleware (not installed at all when no origins are configured)
+if settings.ALLOWED_ORIGINS:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.ALLOWED_ORIGINS,  # "*" by default for testing
+        allow_credentials=True,
+        allow_methods=["GET", "POST"],  # The only methods the API serves
+        allow_headers=["*"],
+    )
 
-# Initialize database on startup
-@app.on_event("startup")
-def on_startup():
-    init_db()
-    print("✅ Database initialized")
-    print(f"🔐 Using SECRET_KEY: {settings.SECRET_KEY[:20]}...")
-    print(f"📁 Database: {settings.DATABASE_URL}")
+# Debug endpoints take no input; keep the per-request DB session out of the cache key
+def _debug_cache_key(func, namespace="", request=None, response=None, args=None, kwargs=None):
+    return f"{FastAPICache.get_prefix()}:{namespace}:{func.__module__}:{func.__name__}"
 
-# Helper function for time calculations
-def _calculate_seconds_until(expiry_time):
-    """Calculate seconds until expiry (simple version)"""
-    return TimeUtils.seconds_until(expiry_time)  # Use TimeUtils
+# Request-scoped clock: sampled once per request as integer unix seconds
+def request_timestamp() -> int:
+    return int(time.time())
 
 # Health check endpoint
 @app.get("/")
@@ -83,14 +214,15 @@ async def upload_content(
     trusted_devices: str = Form(None),
     pin: str = Form(...),  # Client provides PIN
     key_hash: str = Form(...),  # Client provides key hash
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    now_ts: int = Depends(request_timestamp),
 ):
     """
     Upload encrypted content with zero-knowledge encryption.
     Backend never sees the encryption key, only stores its hash.
     """
     try:
-        print(f"📤 Upload request: {file.filename}, Client type: {content_type}, PIN: {pin}")
+        logger.debug("📤 Upload request: %s, Client type: %s, PIN: %s", file.filename, content_type, pin)
         
         # Validate PIN (client provides 4-digit PIN)
         if not pin or len(pin) != 4 or not pin.isdigit():
@@ -100,45 +232,68 @@ async def upload_content(
         if not ContentUtils.validate_content_type(content_type):
             raise HTTPException(status_code=400, detail=f"Invalid content type: {content_type}")
         
+        # Get MIME type - prefer provided, fallback to detected
+        actual_mime_type = mime_type or file.content_type
+        if not actual_mime_type and file.filename:
+            actual_mime_type = ContentUtils.get_mime_type(file.filename)
+        
+        # If client says it's text but no MIME type, set it
+        if content_type == "text" and not actual_mime_type:
+            actual_mime_type = "text/plain"
+        
+        # Validate the resolved MIME type (it is stored and served as the stream's media type)
+        if actual_mime_type and actual_mime_type not in settings.ALLOWED_CONTENT_TYPES:
+            raise HTTPException(status_code=415, detail=f"Unsupported MIME type: {actual_mime_type}")
+        
+        # A PIN must resolve to exactly one live content
+        pin_lookup = SecurityUtils.pin_lookup(pin)
+        pin_in_use = await db.scalar(
+            select(PIN.id).join(Content).where(
+                PIN.pin_lookup_hmac == pin_lookup,
+                PIN.is_active == True,
+                Content.status == "active",
+                or_(Content.expires_at_ts.is_(None), Content.expires_at_ts > now_ts)
+            ).limit(1)
+        )
+        if pin_in_use:
+            raise HTTPException(status_code=409, detail="PIN already in use")
+        
         # Generate content ID
-        content_id = str(uuid.uuid4())
+        content_id = SecurityUtils.generate_record_id()
         
         # Save encrypted file (backend cannot read it)
         file_url = await FileUtils.save_uploaded_file(file, content_id)
-        print(f"✅ File saved: {file_url}")
+        logger.debug("✅ File saved: %s", file_url)
+        
+        # One clock reading for every derived timestamp in this request
+        now = datetime.utcfromtimestamp(now_ts)
         
         # Calculate expiry time
         expires_at = None
+        expires_at_ts = None
         if access_mode == "time_based" and duration_minutes:
-            expires_at = datetime.utcnow() + timedelta(minutes=duration_minutes)
-            print(f"📅 Content expiry set to: {expires_at.isoformat()}")
-            print(f"⏰ That's {duration_minutes} minutes from now")
+            expires_at = now + timedelta(minutes=duration_minutes)
+            expires_at_ts = now_ts + duration_minutes * 60
+            logger.debug("📅 Content expiry set to: %s (%s minutes from now)", expires_at, duration_minutes)
         
         # Get file metadata
         actual_file_name = file_name or file.filename or "encrypted_file"
         actual_file_size = file_size or 0
         
-        # Get MIME type - prefer provided, fallback to detected
-        actual_mime_type = mime_type or file.content_type
-        if not actual_mime_type and file.filename:
-            actual_mime_type = ContentUtils.get_mime_type(file.filename)
-        
-        # If client says it's text but no MIME type, set it
-        if content_type == "text" and not actual_mime_type:
-            actual_mime_type = "text/plain"
-        
-        # Create content record - ZERO-KNOWLEDGE (only stores key hash)
-        content = Content(
+        # Content row - ZERO-KNOWLEDGE (only stores key hash)
+        content_values = dict(
             id=content_id,
             content_key_hash=key_hash,  # Only store hash, never the key
             iv=iv,
             encrypted_data_url=file_url,
+            public_url=FileUtils.get_file_url(file_url),
             content_type=content_type,  # Use client-specified type
             file_name=actual_file_name,
             file_size=actual_file_size,
             mime_type=actual_mime_type,
             access_mode=access_mode,
             expires_at=expires_at,
+            expires_at_ts=expires_at_ts,
             max_devices=device_limit,
             current_devices=0,  # Initialize to 0
             dynamic_pin=dynamic_pin,
@@ -151,37 +306,55 @@ async def upload_content(
         
         # Hash the PIN (backend stores only hash for verification)
         pin_hash = SecurityUtils.hash_pin(pin)
-        print(f"🔒 PIN hash created: {pin_hash[:30]}...")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("🔒 PIN hash created: %s...", pin_hash[:30])
+        
+        # Rotation schedule only exists for dynamic PINs with an interval
+        rotation_schedule = None
+        if dynamic_pin and pin_rotation_minutes:
+            next_rotation = now + timedelta(minutes=pin_rotation_minutes)
+            rotation_schedule = {
+                "interval_minutes": pin_rotation_minutes,
+                "next_rotation": next_rotation.isoformat()
+            }
         
-        # Create PIN record
-        pin_record = PIN(
+        # PIN row
+        pin_values = dict(
             content_id=content_id,
             pin_hash=pin_hash,
-            pin_value=SecurityUtils.encrypt_key_for_storage(pin),  # Encrypted at rest
+            pin_lookup_hmac=pin_lookup,
             is_active=True,
             expires_at=expires_at,
             failed_attempts=0,  # Initialize
-            rotation_schedule={
-                "interval_minutes": pin_rotation_minutes,
-                "next_rotation": (datetime.utcnow() + timedelta(minutes=pin_rotation_minutes)).isoformat() 
-                if dynamic_pin and pin_rotation_minutes else None
-            } if dynamic_pin else None
+            rotation_schedule=rotation_schedule
         )
         
-        # Save to database
-        db.add(content)
-        db.add(pin_record)
-        db.commit()
-        db.refresh(content)
-        
-        print(f"✅ Content uploaded: {content_id}, Type: {content_type}, Expires: {expires_at}")
-        print(f"📌 PIN stored in database for content: {content_id}")
+        # Save to database with plain Core inserts; nothing here needs the ORM objects
+        await db.execute(insert(Content).values(**content_values))
+        await db.execute(insert(PIN).values(**pin_values))
+        await db.commit()
+        if SessionCache.enabled():
+            # The upload is committed; a filter missing this PIN would 404 it,
+            # so on failure stop trusting the filter rather than fail the request
+            try:
+                await SessionCache.add_active_pin(pin_lookup)
+            except RedisError as e:
+                # This process stops trusting the filter until the flush loop reloads
+                # it; other processes see the dropped marker, if Redis takes it
+                logger.warning("⚠️ Active PIN filter update failed, falling back to SQL: %s", e)
+                SessionCache.distrust_active_pins()
+                try:
+                    await SessionCache.mark_active_pins_incomplete()
+                except RedisError as e:
+                    logger.warning("⚠️ Could not mark the active PIN filter incomplete: %s", e)
+        
+        logger.info("✅ Content uploaded: %s, Type: %s, Expires: %s", content_id, content_type, expires_at)
         
         # Return success - backend NEVER returns encryption keys
         return {
             "content_id": content_id,
             "iv": iv,
-            "expiry_time": expires_at.isoformat() if expires_at else None,
+            "expiry_time": expires_at,
             "access_mode": access_mode,
             "device_limit": device_limit,
             "dynamic_pin": dynamic_pin,
@@ -192,8 +365,8 @@ async def upload_content(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
-        print(f"❌ Upload error: {str(e)}")
+        await db.rollback()
+        logger.error("❌ Upload error: %s", e)
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 # ========== CONTENT ACCESS ENDPOINT ========== (FIXED)
@@ -201,7 +374,8 @@ async def upload_content(
 async def access_content(
     pin: str,
     device_info: dict,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    now_ts: int = Depends(request_timestamp),
 ):
     """
     Access content using PIN.
@@ -209,30 +383,55 @@ async def access_content(
     Returns encrypted file URL for client-side decryption.
     """
     try:
-        print(f"🔑 Access attempt with PIN: {pin}")
+        logger.debug("🔑 Access attempt with PIN: %s", pin)
         
-        # DEBUG: List all PINs in database
-        all_pins = db.query(PIN).all()
-        print(f"🔍 Database has {len(all_pins)} PIN records")
+        if settings.DEBUG:
+            logger.debug("🔍 Database has %d PIN records", await db.scalar(select(func.count()).select_from(PIN)))
         
-        # Find the correct PIN by checking ALL PIN hashes
-        pin_record = None
-        for p in all_pins:
-            if SecurityUtils.verify_pin(pin, p.pin_hash) and p.is_active:
-                pin_record = p
-                print(f"✅ Found PIN match for {pin} with content: {p.content_id}")
-                break
+        # PINs the cache knows to be dead are rejected before any SQL
+        pin_lookup = SecurityUtils.pin_lookup(pin)
+        if SessionCache.enabled():
+            try:
+                pin_may_exist = await SessionCache.pin_may_exist(pin_lookup)
+            except RedisError as e:
+                logger.warning("⚠️ Active PIN filter unavailable, checking SQL: %s", e)
+                pin_may_exist = True
+            if not pin_may_exist:
+                raise HTTPException(status_code=404, detail="PIN not found")
+        
+        device_fingerprint = device_info.get("device_fingerprint", "")
+        
+        # One round-trip: the PIN by its indexed lookup key, its content, and this
+        # device's active session if it has one; the hash is confirmed below
+        row = (await db.execute(
+            select(PIN, Content, AccessSession)
+            .outerjoin(Content, Content.id == PIN.content_id)
+            .outerjoin(AccessSession, and_(
+                AccessSession.content_id == PIN.content_id,
+                AccessSession.device_fingerprint == device_fingerprint,
+                AccessSession.is_active.is_(True)
+            ))
+            .where(
+                PIN.pin_lookup_hmac == pin_lookup,
+                PIN.is_active == True
+            ).order_by(PIN.id.desc()).limit(1)
+        )).first()
+        pin_record, content, existing_session = row if row else (None, None, None)
+        # Verify even on a miss (against a dummy hash) so both paths do the same work
+        stored_hash = pin_record.pin_hash if pin_record else SecurityUtils.DUMMY_PIN_HASH
+        if not SecurityUtils.verify_pin(pin, stored_hash):
+            pin_record = None
+        if pin_record:
+            logger.debug("✅ Found PIN match for %s with content: %s", pin, pin_record.content_id)
         
         if not pin_record:
-            print(f"❌ No PIN found for {pin}")
+            logger.debug("❌ No PIN found for %s", pin)
             raise HTTPException(status_code=404, detail="PIN not found")
         
         # Check if PIN is locked
         if pin_record.is_locked():
             raise HTTPException(status_code=423, detail="PIN locked due to too many attempts")
         
-        # Get content
-        content = db.query(Content).filter(Content.id == pin_record.content_id).first()
         if not content:
             raise HTTPException(status_code=404, detail="Content not found")
         
@@ -242,107 +441,138 @@ async def access_content(
         
         # Handle one-time view
         if content.access_mode == "one_time" and content.views_count > 0:
-            content.status = "viewed"
-            db.commit()
+            await _retire_content(db, content, pin_record, "viewed")
             raise HTTPException(status_code=410, detail="Content already viewed (one-time view)")
         
         # Check if expired
-        if content.expires_at:
-            now = datetime.utcnow()
-            if now > content.expires_at:
-                content.status = "expired"
-                db.commit()
+        if content.expires_at_ts is not None:
+            if now_ts > content.expires_at_ts:
+                await _retire_content(db, content, pin_record, "expired")
                 raise HTTPException(status_code=410, detail="Content expired")
             else:
                 # Debug log
-                time_left = content.expires_at - now
-                print(f"⏰ Content expires in: {TimeUtils.format_time_remaining(content.expires_at)}")
-        
-        # Device limit check
-        device_fingerprint = device_info.get("device_fingerprint", "")
-        
-        # Check if this device already has access
-        existing_session = db.query(AccessSession).filter(
-            AccessSession.content_id == content.id,
-            AccessSession.device_fingerprint == device_fingerprint,
-            AccessSession.is_active == True
-        ).first()
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("⏰ Content expires in: %s", TimeUtils.format_time_remaining_ts(content.expires_at_ts, now_ts))
         
+        # Device limit check: existing_session was loaded with the PIN above
         # If this is a NEW device and device limit is reached, block access
         if not existing_session and content.current_devices >= content.max_devices:
-            print(f"❌ Device limit reached: {content.current_devices}/{content.max_devices}")
+            logger.info("❌ Device limit reached: %s/%s", content.current_devices, content.max_devices)
             raise HTTPException(status_code=403, detail="Device limit reached")
         
-        # Create or update access session
+        # Check if biometric is required
+        if content.require_biometric and not device_info.get("biometric_verified", False):
+            raise HTTPException(status_code=403, detail="Biometric verification required")
+        
+        # Count the view (and the device, if new) in one atomic UPDATE; the WHERE
+        # guards stop concurrent accesses from overshooting the device limit or
+        # viewing one-time content twice
+        counters = update(Content).where(Content.id == content.id)
+        new_counts = {Content.views_count: func.coalesce(Content.views_count, 0) + 1}
+        if content.access_mode == "one_time":
+            counters = counters.where(func.coalesce(Content.views_count, 0) == 0)
+        if not existing_session:
+            counters = counters.where(Content.current_devices < Content.max_devices)
+            new_counts[Content.current_devices] = Content.current_devices + 1
+        result = await db.execute(counters.values(new_counts).execution_options(synchronize_session=False))
+        if result.rowcount == 0:
+            if content.access_mode == "one_time":
+                # Lost the race to the one allowed view
+                await _retire_content(db, content, pin_record, "viewed")
+                raise HTTPException(status_code=410, detail="Content already viewed (one-time view)")
+            logger.info("❌ Device limit reached by a concurrent access: %s", content.id)
+            raise HTTPException(status_code=403, detail="Device limit reached")
+        
+        # Mirror the new counts for the response without queuing another UPDATE
+        set_committed_value(content, "views_count", (content.views_count or 0) + 1)
+        
+        # Create or update access session, stamped with this request's clock
+        now = datetime.utcfromtimestamp(now_ts)
         if not existing_session:
             # This is a NEW device
             session_token = SecurityUtils.generate_session_token()
-            session = AccessSession(
-                id=str(uuid.uuid4()),
+            db.add(AccessSession(
+                id=SecurityUtils.generate_record_id(),
                 content_id=content.id,
                 device_id=device_info.get("device_id", ""),
                 device_fingerprint=device_fingerprint,
                 session_token=session_token,
                 ip_address=device_info.get("ip_address"),
                 user_agent=device_info.get("user_agent"),
-                view_count=0  # Initialize to 0
-            )
-            db.add(session)
+                started_at=now,
+                last_activity=now,
+                view_count=1  # This access is its first view
+            ))
             
-            # Increment device count for NEW device
-            content.current_devices = content.current_devices + 1
-            print(f"📱 New device added. Total devices: {content.current_devices}/{content.max_devices}")
+            set_committed_value(content, "current_devices", content.current_devices + 1)
+            logger.debug("📱 New device added. Total devices: %s/%s", content.current_devices, content.max_devices)
         else:
-            # Existing device - just update session
-            session = existing_session
-            session.update_activity()
-            session_token = session.session_token
-            print(f"📱 Existing device access: {device_fingerprint[:10]}...")
-        
-        # Check if biometric is required
-        if content.require_biometric and not device_info.get("biometric_verified", False):
-            raise HTTPException(status_code=403, detail="Biometric verification required")
-        
-        # Increment view count with null safety
-        content.views_count = (content.views_count or 0) + 1
-        session.view_count = (session.view_count or 0) + 1
+            # Existing device - bump the session in place
+            await db.execute(
+                update(AccessSession)
+                .where(AccessSession.id == existing_session.id)
+                .values(
+                    view_count=func.coalesce(AccessSession.view_count, 0) + 1,
+                    last_activity=now
+                )
+                .execution_options(synchronize_session=False)
+            )
+            session_token = existing_session.session_token
+            logger.debug("📱 Existing device access: %s...", device_fingerprint[:10])
         
         # Reset PIN failed attempts on successful access
-        pin_record.failed_attempts = 0
-        pin_record.locked_until = None
+        if pin_record.failed_attempts or pin_record.locked_until:
+            pin_record.failed_attempts = 0
+            pin_record.locked_until = None
+        
+        await db.commit()
         
-        db.commit()
+        # Relative on-disk path of the stored blob, shared by the cache and the text branch
+        file_path = FileUtils.get_storage_path(content.encrypted_data_url)
         
-        print(f"✅ Access granted: {content.id}, Type: {content.content_type}, Views: {content.views_count}, Devices: {content.current_devices}/{content.max_devices}")
+        if SessionCache.enabled():
+            # The view is committed; failing here must not lose it, and a
+            # session missing from the cache is simply served from SQL
+            try:
+                await SessionCache.store(
+                    session_token, content.id, file_path, content.mime_type,
+                    content.file_name, content.content_type, content.expires_at_ts
+                )
+            except RedisError as e:
+                logger.warning("⚠️ Session cache store failed for %s: %s", content.id, e)
+        
+        logger.info(
+            "✅ Access granted: %s, Type: %s, Views: %s, Devices: %s/%s",
+            content.id, content.content_type, content.views_count, content.current_devices, content.max_devices
+        )
         
         # Calculate views remaining
         views_remaining = max(0, content.max_devices - content.current_devices)
         
         # Get streaming URL
-        encrypted_content_url = FileUtils.get_file_url(content.encrypted_data_url)
+        encrypted_content_url = content.public_url or FileUtils.get_file_url(content.encrypted_data_url)
         encrypted_text_content = ""
         
-        # Handle text content differently
+        # Inline small text payloads; larger ones are fetched via the URL instead
         if content.content_type == "text":
             try:
-                file_path = content.encrypted_data_url
-                if file_path.startswith("/uploads/"):
-                    file_path = file_path[1:]  # Remove leading slash
-                
-                print(f"📄 Looking for text file at: {file_path}")
+                logger.debug("📄 Looking for text file at: %s", file_path)
                 
-                if os.path.exists(file_path):
-                    with open(file_path, 'rb') as f:
-                        file_bytes = f.read()
-                    encrypted_text_content = base64.b64encode(file_bytes).decode('utf-8')
-                    print(f"✅ Read encrypted text: {len(file_bytes)} bytes")
-                else:
-                    print(f"❌ Text file not found: {file_path}")
+                with open(file_path, 'rb') as f:
+                    text_size = os.fstat(f.fileno()).st_size
+                    if text_size <= settings.INLINE_TEXT_MAX_BYTES:
+                        encrypted_text_content = base64.b64encode(f.read()).decode('ascii')
+                        logger.debug("✅ Read encrypted text: %d bytes", text_size)
+                    else:
+                        logger.debug("📡 Text too large to inline (%d bytes), serving URL", text_size)
+            except FileNotFoundError:
+                logger.warning("❌ Text file not found: %s", file_path)
             except Exception as e:
-                print(f"❌ Error reading text content: {e}")
+                logger.error("❌ Error reading text content: %s", e)
         
-        # Return metadata
-        return {
+        # Return metadata; returning the response directly skips FastAPI's jsonable_encoder
+        # pass, leaving orjson to serialize the dict (datetimes included) in one go
+        return ORJSONResponse({
             "content_id": content.id,
             "access_granted": True,
             "session_token": session_token,
@@ -351,29 +581,29 @@ async def access_content(
             "file_size": content.file_size or 0,
             "mime_type": content.mime_type,
             "access_mode": content.access_mode,
-            "expiry_time": content.expires_at.isoformat() if content.expires_at else None,
-            "remaining_time_seconds": _calculate_seconds_until(content.expires_at),
-            "remaining_time_formatted": TimeUtils.format_time_remaining(content.expires_at),
+            "expiry_time": content.expires_at,
+            "remaining_time_seconds": TimeUtils.seconds_until_ts(content.expires_at_ts, now_ts),
+            "remaining_time_formatted": TimeUtils.format_time_remaining_ts(content.expires_at_ts, now_ts),
             "views_remaining": views_remaining,
             "device_limit": content.max_devices,
             "current_devices": content.current_devices,
             "current_views": content.views_count,
             # For text: return encrypted text, for others: return streaming URL
-            "encrypted_content": encrypted_text_content if content.content_type == "text" else "",
-            "encrypted_content_url": encrypted_content_url if content.content_type != "text" else "",
+            "encrypted_content": encrypted_text_content,
+            "encrypted_content_url": encrypted_content_url if not encrypted_text_content else "",
             "streaming_url": f"http://127.0.0.1:8000/content/stream/{content.id}?session_token={session_token}",
             "iv": content.iv,
             "security": {
                 "auto_terminate": content.auto_terminate,
                 "require_biometric": content.require_biometric
             }
-        }
+        })
         
     except HTTPException as he:
-        print(f"❌ Access error: {he.detail}")
+        logger.info("❌ Access error: %s", he.detail)
         raise he
     except Exception as e:
-        print(f"❌ Access failed: {str(e)}")
+        logger.error("❌ Access failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Access failed: {str(e)}")
 
 # ========== STREAM CONTENT ENDPOINT ========== (FIXED)
@@ -381,101 +611,142 @@ async def access_content(
 async def stream_content(
     content_id: str,
     session_token: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    now_ts: int = Depends(request_timestamp),
 ):
     """Stream encrypted content (for secure viewing)"""
     try:
-        # Verify session
-        session = db.query(AccessSession).filter(
-            AccessSession.content_id == content_id,
-            AccessSession.session_token == session_token,
-            AccessSession.is_active == True
-        ).first()
-        
-        if not session:
-            raise HTTPException(status_code=401, detail="Invalid or expired session")
-        
-        content = db.query(Content).filter(Content.id == content_id).first()
-        if not content:
-            raise HTTPException(status_code=404, detail="Content not found")
-        
-        # Check if content is still accessible
-        if content.status != "active":
-            raise HTTPException(status_code=410, detail=f"Content is {content.status}")
-        
-        # Update session activity
-        session.last_activity = datetime.utcnow()
-        session.view_count = (session.view_count or 0) + 1
-        db.commit()
-        
-        # Get file path
-        file_path = content.encrypted_data_url
-        if file_path.startswith("/uploads/"):
-            file_path = file_path[1:]
-        
-        if not os.path.exists(file_path):
+        # Cached sessions are served without touching SQL; views are flushed later
+        cached = None
+        if SessionCache.enabled():
+            try:
+                cached = await SessionCache.get(session_token)
+                if cached and cached["content_id"] == content_id:
+                    await SessionCache.record_view(session_token)
+                else:
+                    cached = None
+            except RedisError as e:
+                # The SQL path below can serve (and count) this view on its own
+                logger.warning("⚠️ Session cache unavailable, streaming from SQL: %s", e)
+                cached = None
+        if cached:
+            file_path = cached["file_path"]
+            content_type = cached["content_type"]
+            media_type = cached["mime_type"]
+            file_name = cached["file_name"]
+        else:
+            # Verify session, reading just the content columns streaming needs (no ORM objects)
+            row = (await db.execute(
+                select(
+                    AccessSession.id.label("session_id"),
+                    Content.id,
+                    Content.status,
+                    Content.encrypted_data_url,
+                    Content.content_type,
+                    Content.mime_type,
+                    Content.file_name,
+                )
+                .outerjoin(Content, Content.id == AccessSession.content_id)
+                .where(
+                    AccessSession.content_id == content_id,
+                    AccessSession.session_token == session_token,
+                    AccessSession.is_active.is_(True)
+                ).limit(1)
+            )).first()
+            
+            if not row:
+                raise HTTPException(status_code=401, detail="Invalid or expired session")
+            
+            if row.id is None:
+                raise HTTPException(status_code=404, detail="Content not found")
+            
+            # Check if content is still accessible
+            if row.status != "active":
+                raise HTTPException(status_code=410, detail=f"Content is {row.status}")
+            
+            # Update session activity in place, without reading the counter first
+            await db.execute(
+                update(AccessSession)
+                .where(AccessSession.id == row.session_id)
+                .values(
+                    last_activity=datetime.utcfromtimestamp(now_ts),
+                    view_count=func.coalesce(AccessSession.view_count, 0) + 1
+                )
+            )
+            await db.commit()
+            
+            # Get file path
+            file_path = FileUtils.get_storage_path(row.encrypted_data_url)
+            content_type = row.content_type
+            media_type = row.mime_type or "application/octet-stream"
+            file_name = row.file_name
+        
+        # One stat serves both the existence check and FileResponse's headers
+        try:
+            stat_result = os.stat(file_path)
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail="File not found")
         
-        print(f"📥 Streaming: {content_id} ({content.content_type}) to session {session_token[:10]}...")
+        logger.debug("📥 Streaming: %s (%s) to session %s...", content_id, content_type, session_token[:10])
         
-        # Determine media type
-        media_type = content.mime_type or "application/octet-stream"
-        
-        return FileResponse(
+        return ChunkedFileResponse(
             file_path,
+            stat_result=stat_result,
             media_type=media_type,
             headers={
                 "X-Content-Type-Options": "nosniff",
-                "Content-Disposition": f'inline; filename="{content.file_name}"',
+                "Content-Disposition": f'inline; filename="{file_name}"',
                 "Cache-Control": "no-store, no-cache, must-revalidate",
                 "Pragma": "no-cache",
                 "Expires": "0"
             }
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"❌ Stream error: {str(e)}")
+        logger.error("❌ Stream error: %s", e)
         raise HTTPException(status_code=500, detail=f"Stream failed: {str(e)}")
 
 # ========== CONTENT MANAGEMENT ENDPOINTS ==========
 @app.post("/content/{content_id}/terminate")
 async def terminate_content(
     content_id: str,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """Terminate content immediately"""
-    content = db.query(Content).filter(Content.id == content_id).first()
+    content = await db.get(Content, content_id)
     if not content:
         raise HTTPException(status_code=404, detail="Content not found")
     
     content.status = "terminated"
     
     # Also deactivate PIN
-    pin = db.query(PIN).filter(PIN.content_id == content_id).first()
+    pin = await db.scalar(select(PIN).where(PIN.content_id == content_id).limit(1))
     if pin:
         pin.is_active = False
     
-    db.commit()
+    await db.commit()
+    if SessionCache.enabled():
+        try:
+            await SessionCache.invalidate_content(content_id)
+            if pin:
+                await _release_pin_lookup(db, pin)
+        except RedisError as e:
+            logger.warning("⚠️ Session cache invalidation failed for %s: %s", content_id, e)
     
     # Try to delete file
-    try:
-        file_path = content.encrypted_data_url
-        if file_path.startswith("/uploads/"):
-            file_path = file_path[1:]
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"🗑️ Deleted file: {file_path}")
-    except Exception as e:
-        print(f"⚠️ Could not delete file: {e}")
+    await FileUtils.delete_file_async(content.encrypted_data_url)
     
     return {"message": "Content terminated", "content_id": content_id}
 
 # ========== DEBUG ENDPOINTS ==========
 @app.get("/debug/content")
-async def debug_content(db: Session = Depends(get_db)):
+@cache(expire=30, key_builder=_debug_cache_key)
+async def debug_content(db: AsyncSession = Depends(get_db)):
     """Debug endpoint to list all content"""
-    contents = db.query(Content).all()
-    pins = db.query(PIN).all()
+    contents = (await db.scalars(select(Content))).all()
+    pins = (await db.scalars(select(PIN))).all()
     
     return {
         "content_count": len(contents),
@@ -504,12 +775,15 @@ async def debug_content(db: Session = Depends(get_db)):
     }
 
 @app.get("/debug/files")
+@cache(expire=30, key_builder=_debug_cache_key)
 async def debug_files():
     """List all files in uploads directory"""
     upload_dir = Path("uploads")
     if not upload_dir.exists():
         return {"files": [], "count": 0}
     
+    # Cached payloads round-trip through fastapi-cache's JSON coder, which
+    # would re-tag datetimes as UTC on a hit, so send plain ISO strings
     files = []
     for file_path in upload_dir.glob("*"):
         files.append({
@@ -524,8 +798,9 @@ async def debug_files():
 async def debug_db_check():
     """Check database connectivity"""
     try:
-        init_db()
-        return {"status": "Database initialized successfully"}
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        return {"status": "Database connection OK"}
     except Exception as e:
         return {"status": "Database error", "error": str(e)}
 
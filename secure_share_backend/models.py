@@ -1,6 +1,5 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Text, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
 from database import Base
 from datetime import datetime, timedelta
 import json
@@ -12,6 +11,7 @@ class Content(Base):
     content_key_hash = Column(String, nullable=False)  # Hash of content key (not the key itself)
     iv = Column(String, nullable=False)  # Initialization vector
     encrypted_data_url = Column(String, nullable=False)  # Cloud storage URL
+    public_url = Column(String, nullable=True)  # Client-facing URL, computed once at upload
     
     # Metadata
     content_type = Column(String, nullable=False)  # text, image, pdf, video, audio
@@ -21,8 +21,9 @@ class Content(Base):
     
     # Access control
     access_mode = Column(String, nullable=False)  # time_based, one_time
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     expires_at = Column(DateTime(timezone=True))
+    expires_at_ts = Column(Integer, nullable=True, index=True)  # Unix seconds, for cheap int compares
     max_devices = Column(Integer, default=1)
     current_devices = Column(Integer, default=0, nullable=False)  # FIXED: added nullable=False
     
@@ -71,9 +72,10 @@ class PIN(Base):
     id = Column(Integer, primary_key=True, index=True)
     content_id = Column(String, ForeignKey("content.id"), nullable=False)
     pin_hash = Column(String, nullable=False)  # Hashed PIN
-    pin_value = Column(String, nullable=False)  # Original PIN (encrypted at rest)
+    pin_lookup_hmac = Column(String, nullable=True)  # Keyed digest for indexed lookup
+    pin_value = Column(String, nullable=True)  # Legacy: encrypted PIN, no longer written
     is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    created_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     expires_at = Column(DateTime(timezone=True), nullable=True)
     rotation_schedule = Column(JSON, nullable=True)
     
@@ -84,6 +86,11 @@ class PIN(Base):
     # Relationships
     content = relationship("Content", back_populates="pins")
     
+    __table_args__ = (
+        Index('ix_pins_lookup_active', 'pin_lookup_hmac', 'is_active'),
+        Index('ix_pins_content_active', 'content_id', 'is_active'),
+    )
+    
     def is_locked(self):
         if self.locked_until:
             return datetime.utcnow() < self.locked_until
@@ -99,8 +106,8 @@ class AccessSession(Base):
     session_token = Column(String, nullable=False)
     
     # Session info
-    started_at = Column(DateTime(timezone=True), server_default=func.now())
-    last_activity = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), default=datetime.utcnow)
+    last_activity = Column(DateTime(timezone=True), default=datetime.utcnow)
     view_count = Column(Integer, default=0, nullable=False)  # FIXED: added nullable=False
     is_active = Column(Boolean, default=True)
     
@@ -111,8 +118,13 @@ class AccessSession(Base):
     # Relationships
     content = relationship("Content", back_populates="access_sessions")
     
+    __table_args__ = (
+        Index('ix_session_content_device_active', 'content_id', 'device_fingerprint', 'is_active'),
+        Index('ix_session_token_active', 'session_token', 'is_active'),  # stream + view write-back
+    )
+    
     def update_activity(self):
-        self.last_activity = func.now()
+        self.last_activity = datetime.utcnow()
 
 class TrustedDevice(Base):
     __tablename__ = "trusted_devices"
@@ -120,10 +132,14 @@ class TrustedDevice(Base):
     id = Column(Integer, primary_key=True, index=True)
     content_id = Column(String, ForeignKey("content.id"), nullable=False)
     device_fingerprint = Column(String, nullable=False)
-    added_at = Column(DateTime(timezone=True), server_default=func.now())
+    added_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     
     # Relationships
     content = relationship("Content", back_populates="trusted_devices")
+    
+    __table_args__ = (
+        Index('ix_trusted_content_device', 'content_id', 'device_fingerprint'),
+    )
 
 class SuspiciousActivity(Base):
     __tablename__ = "suspicious_activities"
@@ -134,10 +150,14 @@ class SuspiciousActivity(Base):
     device_id = Column(String, nullable=True)
     ip_address = Column(String, nullable=True)
     description = Column(Text, nullable=True)
-    detected_at = Column(DateTime(timezone=True), server_default=func.now())
+    detected_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     
     # Relationships
     content = relationship("Content", back_populates="suspicious_activities")
+    
+    __table_args__ = (
+        Index('ix_suspicious_content_detected', 'content_id', 'detected_at'),
+    )
 
 class DestructionCertificate(Base):
     __tablename__ = "destruction_certificates"
@@ -145,7 +165,7 @@ class DestructionCertificate(Base):
     id = Column(String, primary_key=True, index=True)
     content_id = Column(String, nullable=False, unique=True)
     reason = Column(String, nullable=False)  # expired, terminated, viewed, suspicious
-    destroyed_at = Column(DateTime(timezone=True), server_default=func.now())
+    destroyed_at = Column(DateTime(timezone=True), default=datetime.utcnow)
     proof_hash = Column(String, nullable=False)
     signature = Column(String, nullable=False)
     content_metadata = Column(JSON, nullable=True)  # FIXED: changed from 'metadata'
\ No newline at end of file
@@ -1,68 +1,74 @@
 import hashlib
+import hmac
 import secrets
-import string
+from functools import lru_cache
 from datetime import datetime, timedelta
 from typing import Optional
-import json  # ADD THIS
+import orjson
 from cryptography.fernet import Fernet
 import base64
 from config import settings  # ADD THIS
 
+# SECRET_KEY is fixed for the process, so its bytes and the storage cipher are built once
+_SECRET_BYTES = settings.SECRET_KEY.encode()
+_FERNET_KEY = base64.urlsafe_b64encode(hashlib.sha256(_SECRET_BYTES).digest()[:32])
+_CIPHER = Fernet(_FERNET_KEY)
+
+@lru_cache(maxsize=10000)
+def _pin_digest(pin: str) -> str:
+    # The whole 4-digit keyspace fits, so each PIN's HMAC is computed once per process
+    return hmac.new(_SECRET_BYTES, pin.encode(), hashlib.sha256).hexdigest()
+
 class SecurityUtils:
+    # Well-formed hash that hash_pin will not produce; compared against on lookup misses
+    DUMMY_PIN_HASH = "0" * 64
+    
     @staticmethod
     def generate_pin(length: int = 4) -> str:
         """Generate a random numeric PIN"""
-        return ''.join(secrets.choice(string.digits) for _ in range(length))
+        return f"{secrets.randbelow(10 ** length):0{length}d}"
     
     @staticmethod
     def hash_pin(pin: str) -> str:
-        """Hash PIN for storage"""
-        salt = secrets.token_bytes(16)
-        pin_bytes = pin.encode()
-        hash_obj = hashlib.pbkdf2_hmac('sha256', pin_bytes, salt, 100000)
-        return f"{salt.hex()}:{hash_obj.hex()}"
+        """Hash PIN for storage (HMAC-SHA256 keyed by SECRET_KEY)"""
+        # A 4-digit keyspace is exhausted in seconds whatever the KDF cost,
+        # so the server secret, not iteration count, is what protects it
+        return _pin_digest(pin)
     
     @staticmethod
     def verify_pin(pin: str, hashed_pin: str) -> bool:
-        """Verify PIN against hash"""
-        try:
-            salt_hex, hash_hex = hashed_pin.split(':')
-            salt = bytes.fromhex(salt_hex)
-            pin_bytes = pin.encode()
-            hash_obj = hashlib.pbkdf2_hmac('sha256', pin_bytes, salt, 100000)
-            return hash_obj.hex() == hash_hex
-        except:
-            return False
+        """Verify PIN against hash in constant time"""
+        return hmac.compare_digest(SecurityUtils.hash_pin(pin), hashed_pin)
+    
+    @staticmethod
+    def pin_lookup(pin: str) -> str:
+        """Derive a fast, deterministic lookup key for a PIN (not a substitute for hash_pin)"""
+        return _pin_digest(pin)[:16]
     
     @staticmethod
     def generate_session_token() -> str:
         """Generate secure session token"""
         return secrets.token_urlsafe(32)
     
+    @staticmethod
+    def generate_record_id() -> str:
+        """Generate an opaque 32-char hex record ID"""
+        return secrets.token_hex(16)
+    
     @staticmethod
     def generate_device_fingerprint(device_info: dict) -> str:
         """Generate device fingerprint from device info"""
-        device_str = json.dumps(device_info, sort_keys=True)
-        return hashlib.sha256(device_str.encode()).hexdigest()
+        return hashlib.sha256(orjson.dumps(device_info, option=orjson.OPT_SORT_KEYS)).hexdigest()
     
     @staticmethod
     def encrypt_key_for_storage(key: str) -> str:
         """Encrypt content key for storage"""
-        # Use settings.SECRET_KEY from config
-        fernet_key = base64.urlsafe_b64encode(
-            hashlib.sha256(settings.SECRET_KEY.encode()).digest()[:32]
-        )
-        cipher = Fernet(fernet_key)
-        return cipher.encrypt(key.encode()).decode()
+        return _CIPHER.encrypt(key.encode()).decode()
     
     @staticmethod
     def decrypt_key_from_storage(encrypted_key: str) -> str:
         """Decrypt content key from storage"""
-        fernet_key = base64.urlsafe_b64encode(
-            hashlib.sha256(settings.SECRET_KEY.encode()).digest()[:32]
-        )
-        cipher = Fernet(fernet_key)
-        return cipher.decrypt(encrypted_key.encode()).decode()
+        return _CIPHER.decrypt(encrypted_key.encode()).decode()
     
     @staticmethod
     def is_expired(expiry_time: Optional[datetime]) -> bool:
@@ -86,8 +92,7 @@ class SecurityUtils:
         proof_hash = hashlib.sha256(data.encode()).hexdigest()
         
         # Sign with server secret (for verification)
-        signature_data = f"{proof_hash}:{settings.SECRET_KEY}"
-        signature = hashlib.sha256(signature_data.encode()).hexdigest()
+        signature = hmac.new(_SECRET_BYTES, proof_hash.encode(), hashlib.sha256).hexdigest()
         
         return {
             "content_id": content_id,
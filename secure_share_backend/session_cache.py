@@ -0,0 +1,156 @@
+import time
+from typing import Optional, Dict, List, Tuple
+import redis.asyncio as redis
+from config import settings
+
+# Key layout:
+#   session:{token}          hash of what stream_content needs to serve the file
+#   session_views:{token}    views not yet written back to access_sessions
+#   content_sessions:{id}    tokens cached for a content (for invalidation)
+#   sessions:dirty           tokens with pending views
+#   pins:active              lookup keys of PINs that may unlock live content,
+#                            plus a marker member once fully loaded from SQL
+_DIRTY_KEY = "sessions:dirty"
+_ACTIVE_PINS_KEY = "pins:active"
+_ACTIVE_PINS_LOADED = "__loaded__"
+
+# Process-local trust in the active PIN set: every lost update bumps the epoch,
+# and only a load that started at the current epoch makes the set trusted again
+_active_pins_epoch = 0
+_active_pins_loaded_epoch = None
+
+_client = redis.Redis.from_url(settings.REDIS_URL, decode_responses=True) if settings.SESSION_CACHE_ENABLED else None
+
+class SessionCache:
+    @staticmethod
+    def enabled() -> bool:
+        """Whether the Redis session cache is configured"""
+        return _client is not None
+
+    @staticmethod
+    async def close():
+        """Disconnect the pooled Redis connections (they are bound to the running loop)"""
+        await _client.aclose()
+
+    @staticmethod
+    async def store(session_token: str, content_id: str, file_path: str, mime_type: str,
+                    file_name: str, content_type: str, expires_at_ts: Optional[int] = None):
+        """Cache an access session so streaming needs no SQL round-trip"""
+        key = f"session:{session_token}"
+        pipe = _client.pipeline()
+        pipe.hset(key, mapping={
+            "content_id": content_id,
+            "file_path": file_path,
+            "mime_type": mime_type or "application/octet-stream",
+            "file_name": file_name or "",
+            "content_type": content_type,
+        })
+        # The index must outlive every session it lists, or invalidate_content
+        # would miss them: sessions of one content share its expiry, and without
+        # one each store pushes the index TTL past every earlier session's
+        sessions_key = f"content_sessions:{content_id}"
+        pipe.sadd(sessions_key, session_token)
+        for expiring_key in (key, sessions_key):
+            if expires_at_ts:
+                pipe.expireat(expiring_key, expires_at_ts)
+            else:
+                pipe.expire(expiring_key, settings.SESSION_CACHE_TTL)
+        await pipe.execute()
+
+    @staticmethod
+    async def get(session_token: str) -> Optional[Dict[str, str]]:
+        """Get a cached session, or None if it is not cached"""
+        return await _client.hgetall(f"session:{session_token}") or None
+
+    @staticmethod
+    async def record_view(session_token: str):
+        """Count a view and mark the session for the next flush"""
+        views_key = f"session_views:{session_token}"
+        pipe = _client.pipeline()
+        pipe.incr(views_key)
+        pipe.expire(views_key, settings.SESSION_CACHE_TTL)
+        pipe.hset(f"session:{session_token}", "last_activity", int(time.time()))
+        pipe.sadd(_DIRTY_KEY, session_token)
+        await pipe.execute()
+
+    @staticmethod
+    async def invalidate_content(content_id: str):
+        """Drop every cached session of a content that is no longer streamable"""
+        sessions_key = f"content_sessions:{content_id}"
+        tokens = await _client.smembers(sessions_key)
+        if tokens:
+            await _client.delete(*(f"session:{token}" for token in tokens))
+        await _client.delete(sessions_key)
+
+    @staticmethod
+    async def drain_views() -> List[Tuple[str, int, Optional[int]]]:
+        """Take pending (token, views, last_activity_ts) counts for writing back to SQL"""
+        pipe = _client.pipeline()
+        pipe.smembers(_DIRTY_KEY)
+        pipe.delete(_DIRTY_KEY)
+        tokens = list((await pipe.execute())[0])
+        if not tokens:
+            return []
+
+        pipe = _client.pipeline()
+        for token in tokens:
+            pipe.getdel(f"session_views:{token}")
+            pipe.hget(f"session:{token}", "last_activity")
+        results = await pipe.execute()
+
+        drained = []
+        for i, token in enumerate(tokens):
+            views, last_activity = results[2 * i], results[2 * i + 1]
+            if views:
+                drained.append((token, int(views), int(last_activity) if last_activity else None))
+        return drained
+
+    @staticmethod
+    def active_pins_epoch() -> int:
+        """Epoch to pass to load_active_pins, read before querying SQL"""
+        return _active_pins_epoch
+
+    @staticmethod
+    def active_pins_trusted() -> bool:
+        """Whether this process may reject PINs missing from the active set"""
+        return _active_pins_loaded_epoch == _active_pins_epoch
+
+    @staticmethod
+    def distrust_active_pins():
+        """Record a lost update; pin_may_exist fails open until the next load"""
+        global _active_pins_epoch
+        _active_pins_epoch += 1
+
+    @staticmethod
+    async def load_active_pins(pin_lookups: List[str], epoch: int):
+        """Seed the active PIN set from SQL and mark it complete"""
+        global _active_pins_loaded_epoch
+        await _client.sadd(_ACTIVE_PINS_KEY, _ACTIVE_PINS_LOADED, *pin_lookups)
+        _active_pins_loaded_epoch = epoch
+
+    @staticmethod
+    async def add_active_pin(pin_lookup: str):
+        """Mark a PIN lookup key as possibly unlocking live content"""
+        await _client.sadd(_ACTIVE_PINS_KEY, pin_lookup)
+
+    @staticmethod
+    async def mark_active_pins_incomplete():
+        """Drop the loaded marker so pin_may_exist fails open until the next load"""
+        await _client.srem(_ACTIVE_PINS_KEY, _ACTIVE_PINS_LOADED)
+
+    @staticmethod
+    async def remove_active_pin(pin_lookup: str):
+        """Stop treating a PIN lookup key as live"""
+        await _client.srem(_ACTIVE_PINS_KEY, pin_lookup)
+
+    @staticmethod
+    async def pin_may_exist(pin_lookup: str) -> bool:
+        """False only when the PIN definitely unlocks nothing"""
+        if not SessionCache.active_pins_trusted():
+            return True
+        # Without the marker (never loaded, or lost with a Redis restart) the set is incomplete
+        pipe = _client.pipeline()
+        pipe.sismember(_ACTIVE_PINS_KEY, _ACTIVE_PINS_LOADED)
+        pipe.sismember(_ACTIVE_PINS_KEY, pin_lookup)
+        is_loaded, is_member = await pipe.execute()
+        return not is_loaded or bool(is_member)
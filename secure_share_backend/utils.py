@@ -1,89 +1,191 @@
+import asyncio
+import io
 import json
+import logging
 import os
+import shutil
+import sys
+import time
 from pathlib import Path
-from typing import Optional, Dict
+from typing import Optional, Dict, BinaryIO
 from datetime import datetime
-import aiofiles
 from fastapi import UploadFile
 
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1MB
+
+# Created once at import rather than on every upload
+_UPLOAD_DIR = Path("uploads")
+_UPLOAD_DIR.mkdir(exist_ok=True)
+
+# Upload MIME type -> stored file extension
+_CONTENT_TYPE_TO_EXT = {
+    'image/jpeg': 'jpg',
+    'image/jpg': 'jpg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+    'application/pdf': 'pdf',
+    'video/mp4': 'mp4',
+    'video/quicktime': 'mov',
+    'video/webm': 'webm',
+    'audio/mpeg': 'mp3',
+    'audio/mp3': 'mp3',
+    'audio/wav': 'wav',
+    'audio/ogg': 'ogg',
+    'text/plain': 'txt',
+    'text/csv': 'csv',
+    'text/html': 'html',
+    'application/json': 'json',
+    'application/zip': 'zip',
+    'application/x-zip-compressed': 'zip',
+    'application/msword': 'doc',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'docx',
+}
+
+# Top-level MIME type -> extension for content types missing above
+_MIME_PREFIX_TO_EXT = {'image': 'jpg', 'video': 'mp4', 'audio': 'mp3', 'text': 'txt'}
+
+# Stored file extension -> MIME type
+_FILE_EXT_TO_MIME = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+    'pdf': 'application/pdf',
+    'mp4': 'video/mp4',
+    'mov': 'video/quicktime',
+    'webm': 'video/webm',
+    'mp3': 'audio/mpeg',
+    'wav': 'audio/wav',
+    'ogg': 'audio/ogg',
+    'txt': 'text/plain',
+    'csv': 'text/csv',
+    'html': 'text/html',
+    'json': 'application/json',
+    'zip': 'application/zip',
+    'doc': 'application/msword',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+}
+
+# MIME type -> simplified content type
+_MIME_TO_CONTENT_TYPE = {
+    'text/plain': 'text',
+    'image/jpeg': 'image',
+    'image/png': 'image',
+    'image/gif': 'image',
+    'image/webp': 'image',
+    'application/pdf': 'pdf',
+    'video/mp4': 'video',
+    'video/quicktime': 'video',
+    'video/webm': 'video',
+    'audio/mpeg': 'audio',
+    'audio/wav': 'audio',
+    'audio/ogg': 'audio',
+    'application/msword': 'document',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'document',
+    'application/vnd.ms-excel': 'document',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': 'document',
+    'application/vnd.ms-powerpoint': 'document',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation': 'document',
+    'application/octet-stream': 'document',
+}
+
+# Client filename extension -> MIME type
+_CONTENT_EXT_TO_MIME = {
+    'txt': 'text/plain',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+    'pdf': 'application/pdf',
+    'mp4': 'video/mp4',
+    'mov': 'video/quicktime',
+    'webm': 'video/webm',
+    'mp3': 'audio/mpeg',
+    'wav': 'audio/wav',
+    'ogg': 'audio/ogg',
+    'doc': 'application/msword',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'xls': 'application/vnd.ms-excel',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'ppt': 'application/vnd.ms-powerpoint',
+    'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+}
+
+# Top-level MIME type -> simplified content type (anything else is a document)
+_MIME_PREFIX_TO_CONTENT_TYPE = {'image': 'image', 'video': 'video', 'audio': 'audio', 'text': 'text'}
+
+_SIZE_UNITS = ((1, 'B'), (1 << 10, 'KB'), (1 << 20, 'MB'), (1 << 30, 'GB'))
+
+_VALID_CONTENT_TYPES = frozenset({'text', 'image', 'pdf', 'video', 'audio', 'document'})
+
+# File-to-file sendfile() is Linux-only (macOS requires a socket destination)
+_SENDFILE_SUPPORTED = sys.platform.startswith("linux") and hasattr(os, "sendfile")
+
+def _os_fileno(src: BinaryIO) -> Optional[int]:
+    """OS file descriptor backing src, or None while it only lives in memory"""
+    # SpooledTemporaryFile.fileno() would force an in-memory upload onto disk
+    if getattr(src, "_rolled", True) is False:
+        return None
+    try:
+        return src.fileno()
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+def _copy_to_file(src: BinaryIO, file_path: Path):
+    """Copy a file object to disk, in-kernel when it is backed by a real file (blocking)"""
+    src_fd = _os_fileno(src) if _SENDFILE_SUPPORTED else None
+    with open(file_path, 'wb') as out_file:
+        if src_fd is not None:
+            offset = src.tell()
+            try:
+                while sent := os.sendfile(out_file.fileno(), src_fd, offset, UPLOAD_CHUNK_SIZE):
+                    offset += sent
+                return
+            except OSError:
+                # Filesystem without sendfile support: finish with plain reads
+                src.seek(offset)
+        shutil.copyfileobj(src, out_file, UPLOAD_CHUNK_SIZE)
+
 class FileUtils:
     @staticmethod
     async def save_uploaded_file(upload_file: UploadFile, content_id: str) -> str:
         """Save uploaded file to local storage with proper extension handling"""
-        # Create uploads directory if it doesn't exist
-        upload_dir = Path("uploads")
-        upload_dir.mkdir(exist_ok=True)
-        
-        # Map content types to extensions
-        content_type_to_ext = {
-            'image/jpeg': 'jpg',
-            'image/jpg': 'jpg',
-            'image/png': 'png',
-            'image/gif': 'gif',
-            'image/webp': 'webp',
-            'application/pdf': 'pdf',
-            'video/mp4': 'mp4',
-            'video/quicktime': 'mov',
-            'video/webm': 'webm',
-            'audio/mpeg': 'mp3',
-            'audio/mp3': 'mp3',
-            'audio/wav': 'wav',
-            'audio/ogg': 'ogg',
-            'text/plain': 'txt',
-            'text/csv': 'csv',
-            'text/html': 'html',
-            'application/json': 'json',
-            'application/zip': 'zip',
-            'application/x-zip-compressed': 'zip',
-            'application/msword': 'doc',
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'docx',
-        }
         
         # Get original filename and content type
         original_filename = upload_file.filename or "file"
         content_type = (upload_file.content_type or "").lower()
         
-        # Determine file extension
-        file_ext = ""
-        
-        # First, try to get extension from original filename
-        if '.' in original_filename:
-            file_ext = original_filename.split('.')[-1].lower()
+        # Determine file extension, first from the original filename
+        _, dot, file_ext = original_filename.rpartition('.')
+        file_ext = file_ext.lower() if dot else ""
         
-        # If no extension from filename, try to get from content type
-        if not file_ext and content_type:
-            file_ext = content_type_to_ext.get(content_type, 'dat')
-        
-        # If still no extension, use a default based on content type pattern
+        # If no extension from filename, try the exact content type, then
+        # fall back to a default for its top-level type
         if not file_ext:
-            if 'image' in content_type:
-                file_ext = 'jpg'
-            elif 'pdf' in content_type:
-                file_ext = 'pdf'
-            elif 'video' in content_type:
-                file_ext = 'mp4'
-            elif 'audio' in content_type:
-                file_ext = 'mp3'
-            elif 'text' in content_type:
-                file_ext = 'txt'
-            else:
-                file_ext = 'dat'
+            file_ext = _CONTENT_TYPE_TO_EXT.get(content_type) or \
+                _MIME_PREFIX_TO_EXT.get(content_type.partition('/')[0], 'dat')
         
-        # Ensure extension is safe (alphanumeric only)
-        file_ext = ''.join(c for c in file_ext if c.isalnum()).lower()
+        # Ensure extension is safe (alphanumeric only); usually it already is,
+        # so the C-level isalnum() check skips the per-character filter
+        if not file_ext.isalnum():
+            file_ext = ''.join(filter(str.isalnum, file_ext))
         if not file_ext:
             file_ext = 'dat'
         
         # Generate filename
         filename = f"{content_id}.{file_ext}"
-        file_path = upload_dir / filename
+        file_path = _UPLOAD_DIR / filename
         
-        # Save file
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            content = await upload_file.read()
-            await out_file.write(content)
+        # Save file in chunks on a worker thread so large uploads neither
+        # block the event loop nor get buffered whole in memory
+        await asyncio.to_thread(_copy_to_file, upload_file.file, file_path)
         
-        print(f"💾 File saved: {filename} (type: {content_type}, ext: .{file_ext})")
+        logger.debug("💾 File saved: %s (type: %s, ext: .%s)", filename, content_type, file_ext)
         
         # Return file URL/path
         return f"/uploads/{filename}"
@@ -94,202 +196,150 @@ class FileUtils:
         # Use 127.0.0.1 instead of localhost for better compatibility
         return f"http://127.0.0.1:8000{file_path}"
     
+    @staticmethod
+    def get_storage_path(file_url: str) -> str:
+        """Get the on-disk path for a stored /uploads/ URL"""
+        if file_url.startswith("/uploads/"):
+            return file_url[1:]  # Remove leading slash
+        return file_url
+    
     @staticmethod
     def delete_file(file_path: str):
         """Delete file from storage"""
         try:
-            # Remove /uploads/ prefix if present
-            if file_path.startswith("/uploads/"):
-                file_path = file_path[1:]
-            
-            path = Path(file_path)
-            if path.exists():
-                path.unlink()
-                print(f"🗑️ Deleted file: {file_path}")
+            file_path = FileUtils.get_storage_path(file_path)
+            # One unlink instead of a stat followed by an unlink
+            os.unlink(file_path)
+            logger.debug("🗑️ Deleted file: %s", file_path)
+        except FileNotFoundError:
+            pass
         except Exception as e:
-            print(f"⚠️ Error deleting file {file_path}: {e}")
+            logger.warning("⚠️ Error deleting file %s: %s", file_path, e)
+    
+    @staticmethod
+    async def delete_file_async(file_path: str):
+        """Delete file from storage on a worker thread"""
+        # The stat/unlink syscalls can stall on slow or network-mounted disks
+        await asyncio.to_thread(FileUtils.delete_file, file_path)
     
     @staticmethod
     def get_file_extension(file_path: str) -> str:
         """Get file extension from path"""
-        path = Path(file_path)
-        if '.' in path.name:
-            return path.name.split('.')[-1].lower()
-        return ""
+        _, dot, ext = os.path.basename(file_path).rpartition('.')
+        return ext.lower() if dot else ""
     
     @staticmethod
     def guess_content_type_from_extension(file_path: str) -> str:
         """Guess content type from file extension"""
         ext = FileUtils.get_file_extension(file_path)
-        
-        ext_to_mime = {
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg',
-            'png': 'image/png',
-            'gif': 'image/gif',
-            'webp': 'image/webp',
-            'pdf': 'application/pdf',
-            'mp4': 'video/mp4',
-            'mov': 'video/quicktime',
-            'webm': 'video/webm',
-            'mp3': 'audio/mpeg',
-            'wav': 'audio/wav',
-            'ogg': 'audio/ogg',
-            'txt': 'text/plain',
-            'csv': 'text/csv',
-            'html': 'text/html',
-            'json': 'application/json',
-            'zip': 'application/zip',
-            'doc': 'application/msword',
-            'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-        }
-        
-        return ext_to_mime.get(ext, 'application/octet-stream')
+        return _FILE_EXT_TO_MIME.get(ext, 'application/octet-stream')
 
 class ContentUtils:
     @staticmethod
     def validate_content_type(content_type: str) -> bool:
         """Validate content type"""
-        valid_types = ['text', 'image', 'pdf', 'video', 'audio', 'document']
-        return content_type in valid_types
+        return content_type in _VALID_CONTENT_TYPES
     
     @staticmethod
     def format_file_size(size_bytes: int) -> str:
         """Format file size for display"""
-        if size_bytes is None:
-            return "0 B"
+        if not size_bytes or size_bytes < 1024:
+            return f"{size_bytes or 0} B"
         
-        if size_bytes < 1024:
-            return f"{size_bytes} B"
-        elif size_bytes < 1024 * 1024:
-            return f"{size_bytes / 1024:.1f} KB"
-        elif size_bytes < 1024 * 1024 * 1024:
-            return f"{size_bytes / (1024 * 1024):.1f} MB"
-        else:
-            return f"{size_bytes / (1024 * 1024 * 1024):.1f} GB"
+        # Each unit is 10 bits wide, so the bit length picks it without a comparison ladder
+        divisor, suffix = _SIZE_UNITS[min((size_bytes.bit_length() - 1) // 10, 3)]
+        return f"{size_bytes / divisor:.1f} {suffix}"
     
     @staticmethod
     def get_content_type_from_mime(mime_type: str) -> str:
         """Map MIME type to content type"""
-        mime_to_type = {
-            'text/plain': 'text',
-            'image/jpeg': 'image',
-            'image/png': 'image',
-            'image/gif': 'image',
-            'image/webp': 'image',
-            'application/pdf': 'pdf',
-            'video/mp4': 'video',
-            'video/quicktime': 'video',
-            'video/webm': 'video',
-            'audio/mpeg': 'audio',
-            'audio/wav': 'audio',
-            'audio/ogg': 'audio',
-            'application/msword': 'document',
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'document',
-            'application/vnd.ms-excel': 'document',
-            'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': 'document',
-            'application/vnd.ms-powerpoint': 'document',
-            'application/vnd.openxmlformats-officedocument.presentationml.presentation': 'document',
-            'application/octet-stream': 'document',
-        }
-        return mime_to_type.get(mime_type, 'document')
+        return _MIME_TO_CONTENT_TYPE.get(mime_type, 'document')
     
     @staticmethod
     def get_mime_type(filename: str) -> str:
         """Get MIME type from filename"""
-        ext = filename.split('.')[-1].lower() if '.' in filename else ''
-        mime_map = {
-            'txt': 'text/plain',
-            'jpg': 'image/jpeg',
-            'jpeg': 'image/jpeg',
-            'png': 'image/png',
-            'gif': 'image/gif',
-            'webp': 'image/webp',
-            'pdf': 'application/pdf',
-            'mp4': 'video/mp4',
-            'mov': 'video/quicktime',
-            'webm': 'video/webm',
-            'mp3': 'audio/mpeg',
-            'wav': 'audio/wav',
-            'ogg': 'audio/ogg',
-            'doc': 'application/msword',
-            'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'xls': 'application/vnd.ms-excel',
-            'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            'ppt': 'application/vnd.ms-powerpoint',
-            'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-        }
-        return mime_map.get(ext, 'application/octet-stream')
+        _, dot, ext = filename.rpartition('.')
+        ext = ext.lower() if dot else ''
+        return _CONTENT_EXT_TO_MIME.get(ext, 'application/octet-stream')
     
     @staticmethod
     def get_simplified_content_type(mime_type: str) -> str:
         """Get simplified content type (image, video, audio, pdf, document, text)"""
         mime = mime_type.lower()
-        if mime.startswith('image/'):
-            return 'image'
-        elif mime.startswith('video/'):
-            return 'video'
-        elif mime.startswith('audio/'):
-            return 'audio'
-        elif mime == 'application/pdf':
+        if mime == 'application/pdf':
             return 'pdf'
-        elif mime.startswith('text/'):
-            return 'text'
-        else:
-            return 'document'
+        prefix, slash, _ = mime.partition('/')
+        return _MIME_PREFIX_TO_CONTENT_TYPE.get(prefix, 'document') if slash else 'document'
 
 class TimeUtils:
     @staticmethod
-    def format_time_remaining(expiry_time: Optional[datetime]) -> str:
+    def format_time_remaining(expiry_time: Optional[datetime], now: Optional[datetime] = None) -> str:
         """Format time remaining for display"""
         if not expiry_time:
             return "No expiry"
         
-        now = datetime.utcnow()
+        now = now or datetime.utcnow()
         if now > expiry_time:
             return "Expired"
         
-        delta = expiry_time - now
-        total_seconds = int(delta.total_seconds())
+        return TimeUtils.format_seconds_remaining(int((expiry_time - now).total_seconds()))
+    
+    @staticmethod
+    def format_time_remaining_ts(expires_at_ts: Optional[int], now_ts: Optional[int] = None) -> str:
+        """Format time remaining for display from a unix-seconds deadline"""
+        if expires_at_ts is None:
+            return "No expiry"
         
+        remaining = expires_at_ts - (int(time.time()) if now_ts is None else now_ts)
+        if remaining < 0:
+            return "Expired"
+        
+        return TimeUtils.format_seconds_remaining(remaining)
+    
+    @staticmethod
+    def format_seconds_remaining(total_seconds: int) -> str:
+        """Format a non-negative number of seconds as a compact countdown"""
         if total_seconds < 60:
             return f"{total_seconds}s"
         elif total_seconds < 3600:
-            minutes = total_seconds // 60
-            seconds = total_seconds % 60
+            minutes, seconds = divmod(total_seconds, 60)
             return f"{minutes}m {seconds}s"
         elif total_seconds < 86400:
-            hours = total_seconds // 3600
-            minutes = (total_seconds % 3600) // 60
-            return f"{hours}h {minutes}m"
+            hours, rem = divmod(total_seconds, 3600)
+            return f"{hours}h {rem // 60}m"
         else:
-            days = total_seconds // 86400
-            hours = (total_seconds % 86400) // 3600
-            minutes = (total_seconds % 3600) // 60
-            return f"{days}d {hours}h {minutes}m"
+            days, rem = divmod(total_seconds, 86400)
+            hours, rem = divmod(rem, 3600)
+            return f"{days}d {hours}h {rem // 60}m"
     
     @staticmethod
-    def seconds_until(expiry_time: Optional[datetime]) -> int:
+    def seconds_until(expiry_time: Optional[datetime], now: Optional[datetime] = None) -> int:
         """Get seconds until expiry"""
         if not expiry_time:
             return 0
         
-        now = datetime.utcnow()
+        now = now or datetime.utcnow()
         if now > expiry_time:
             return 0
         
         delta = expiry_time - now
         return int(delta.total_seconds())
     
+    @staticmethod
+    def seconds_until_ts(expires_at_ts: Optional[int], now_ts: Optional[int] = None) -> int:
+        """Get seconds until a unix-seconds deadline"""
+        if expires_at_ts is None:
+            return 0
+        return max(0, expires_at_ts - (int(time.time()) if now_ts is None else now_ts))
+    
     @staticmethod
     def format_duration_hhmmss(total_seconds: int) -> str:
         """Format seconds as HH:MM:SS"""
         if total_seconds < 0:
             total_seconds = 0
         
-        hours = total_seconds // 3600
-        minutes = (total_seconds % 3600) // 60
-        seconds = total_seconds % 60
+        hours, rem = divmod(total_seconds, 3600)
+        minutes, seconds = divmod(rem, 60)
         
         if hours > 0:
             return f"{hours:02d}:{minutes:02d}:{seconds:02d}"